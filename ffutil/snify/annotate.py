@@ -6,17 +6,16 @@ from pylatexenc.latexwalker import LatexEnvironmentNode
 
 from ffutil.snify.catalog import Verbalization
 from ffutil.stepper.document import STeXDocument
-from ffutil.stex.local_stex import OpenedStexFLAMSFile, get_transitive_imports, FlamsUri, get_transitive_structs
+from ffutil.stex.local_stex import OpenedStexFLAMSFile, get_transitive_imports, FlamsUri, get_transitive_structs, \
+    get_transitive_import_uris
 from ffutil.snify.local_stex_catalog import LocalStexSymbol, LocalFlamsCatalog
 from ffutil.snify.snify_commands import ImportCommand
 from ffutil.stepper.document_stepper import SubstitutionOutcome
 from ffutil.snify.snifystate import SnifyState, SnifyCursor
-from ffutil.stex.stex_py_parsing import iterate_latex_nodes
 from ffutil.stepper.command import Command, CommandInfo, CommandOutcome, CommandCollection
 from ffutil.stepper.interface import interface
 from ffutil.stepper.stepper_extensions import QuitCommand, QuitOutcome, SetCursorOutcome
 from ffutil.stex.flams import FLAMS
-from ffutil.utils.json_iter import json_iter
 
 
 class AnnotationAborted(Exception):
@@ -258,12 +257,10 @@ class STeXAnnotateCommand(STeXAnnotateBase, Command):
         style = interface.apply_style
         for i, (symbol, verbalization) in enumerate(self.options):
             assert isinstance(symbol, LocalStexSymbol)
-            module_uri_f = FlamsUri(symbol.uri)
-            module_uri_f.symbol = None
             symbol_display = ' '
             symbol_display += (
                 style('✓', 'correct-weak')
-                if str(module_uri_f) in self.importinfo.modules_in_scope
+                if symbol.module_uri in self.importinfo.modules_in_scope
                 else style('✗', 'error-weak')
             )
             uri = FlamsUri(symbol.uri)
@@ -328,9 +325,9 @@ class STeXLookupCommand(STeXAnnotateBase, Command):
 
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class _ImportInfo:
-    modules_in_scope: set[str]
+    modules_in_scope: frozenset[str]
     structs_in_scope: set[str]
     top_use_pos: int
     use_pos: int
@@ -382,6 +379,34 @@ class _ImportInfo:
                 yield SubstitutionOutcome('', from_, to)
 
 
+# keys of the annotations that are relevant for the import information (in order of precedence)
+_IMPORT_ANNOTATION_KEYS = ('ImportModule', 'UseModule', 'UseStructure', 'Module', 'MathStructure')
+
+
+def _iter_import_annotations(annos) -> Iterable[tuple[str, dict]]:
+    """
+    Yields (key, value) for the import-related annotations (see _IMPORT_ANNOTATION_KEYS) in document order.
+
+    This replaces a generic json_iter, which is slow for large files
+    because it also visits every leaf (strings, numbers, ...) of the annotation tree.
+    """
+    stack = [annos]
+    while stack:
+        j = stack.pop()
+        if isinstance(j, dict):
+            for key in _IMPORT_ANNOTATION_KEYS:
+                if key in j:
+                    yield key, j[key]
+                    break
+            stack.extend(v for v in reversed(j.values()) if isinstance(v, (dict, list)))
+        elif isinstance(j, list):
+            stack.extend(v for v in reversed(j) if isinstance(v, (dict, list)))
+
+
+# environments in which \usemodule can be placed
+_CONTAINER_ENVS = frozenset({'sproblem', 'smodule', 'sdefinition', 'sparagraph', 'document', 'frame'})
+
+
 def get_modules_in_scope_and_import_locations(document: STeXDocument, offset: int) -> _ImportInfo:
     """
     collects import information and potential import locations in the document.
@@ -395,17 +420,21 @@ def get_modules_in_scope_and_import_locations(document: STeXDocument, offset: in
     annos = FLAMS.get_file_annotations(document.path)
     file = OpenedStexFLAMSFile(str(document.path))
     surrounding_envs = get_surrounding_envs(document, offset)
-    surrounding_envs_pos = [e.pos for e in surrounding_envs]
+    # position of surrounding environment -> depth (also used for membership checks)
+    surrounding_envs_depth = {e.pos: i for i, e in enumerate(surrounding_envs)}
 
     # STEP 1: find interesting environments for new imports/uses
+    # (the innermost smodule and the innermost container environment)
     module_env: Optional[LatexEnvironmentNode] = None
-    _modules = [e for e in surrounding_envs if e.environmentname == 'smodule']
-    if _modules:
-        module_env = _modules[-1]
-    _containers = [e for e in surrounding_envs if e.environmentname in {
-        'sproblem', 'smodule', 'sdefinition', 'sparagraph', 'document', 'frame'
-    }]
-    use_env = _containers[-1] if _containers else None
+    use_env: Optional[LatexEnvironmentNode] = None
+    for e in reversed(surrounding_envs):
+        name = e.environmentname
+        if use_env is None and name in _CONTAINER_ENVS:
+            use_env = e
+        if module_env is None and name == 'smodule':
+            module_env = e
+        if use_env is not None and module_env is not None:
+            break
 
     pot_red_on_use = {}
     pot_red_on_import = {}
@@ -417,10 +446,9 @@ def get_modules_in_scope_and_import_locations(document: STeXDocument, offset: in
     # STEP 2: find modules in scope and the imports/uses
     available_modules: list[tuple[str, str]] = []   # (module uri, module path)
     available_structs: list[tuple[str, str]] = []   # (structure uri, structure path)
-    for item in json_iter(annos):
-        if isinstance(item, dict) and ('ImportModule' in item or 'UseModule' in item or 'UseStructure' in item):
-            value = item.get('ImportModule') or item.get('UseModule') or item.get('UseStructure')
-            is_struct = 'UseStructure' in item
+    for key, value in _iter_import_annotations(annos):
+        if key in {'ImportModule', 'UseModule', 'UseStructure'}:
+            is_struct = key == 'UseStructure'
             full_range = file.flams_range_to_offsets(value['full_range'])
             containing_envs = list(get_surrounding_envs(document, full_range[0]))
 
@@ -438,40 +466,39 @@ def get_modules_in_scope_and_import_locations(document: STeXDocument, offset: in
 
 
             containing_env = containing_envs[-1]
-            if containing_env.pos in surrounding_envs_pos:
+            if containing_env.pos in surrounding_envs_depth:
                 if is_struct:
                     available_structs.append((uri, full_path))
                 else:
                     available_modules.append((uri, full_path))
 
-                if 'ImportModule' in item and module_env.pos == containing_env.pos:
+                if key == 'ImportModule' and module_env.pos == containing_env.pos:
                     pot_red_on_import.setdefault(uri, []).append(full_range)
-                elif 'UseModule' in item:
+                elif key == 'UseModule':
                     pot_red_on_top_use.setdefault(uri, []).append(full_range)
-                    if use_env and surrounding_envs_pos.index(containing_env.pos) >= surrounding_envs_pos.index(use_env.pos):
+                    if use_env and surrounding_envs_depth[containing_env.pos] >= surrounding_envs_depth[use_env.pos]:
                         pot_red_on_use.setdefault(uri, []).append(full_range)
                 else:
                     assert is_struct
                     pot_red_on_top_use_struct.setdefault(uri, []).append(full_range)
                     if module_env.pos == containing_env.pos:
                         pot_red_on_import_use_struct.setdefault(uri, []).append(full_range)
-                    if use_env and surrounding_envs_pos.index(containing_env.pos) >= surrounding_envs_pos.index(use_env.pos):
+                    if use_env and surrounding_envs_depth[containing_env.pos] >= surrounding_envs_depth[use_env.pos]:
                         pot_red_on_use_struct.setdefault(uri, []).append(full_range)
 
-        elif isinstance(item, dict) and ('Module' in item or 'MathStructure' in item):
-            value = item.get('Module') or item.get('MathStructure')
+        else:   # Module or MathStructure
             module_offset = file.flams_range_to_offsets(value['name_range'])[0]   # lots of things would work here
             containing_envs = list(get_surrounding_envs(document, module_offset))
             assert containing_envs
             containing_env = containing_envs[-1]
-            if containing_env.pos in surrounding_envs_pos:
-                if 'Module' in item:
+            if containing_env.pos in surrounding_envs_depth:
+                if key == 'Module':
                     available_modules.append((value['uri'], str(document.path)))
                 else:
                     available_structs.append((value['uri'], str(document.path)))
 
     return _ImportInfo(
-        modules_in_scope = set(get_transitive_imports(available_modules)),
+        modules_in_scope = get_transitive_import_uris(available_modules),
         structs_in_scope = set(get_transitive_structs(available_structs)),
         top_use_pos = surrounding_envs[0].nodelist[0].pos if surrounding_envs else 0,
         use_pos = use_env.nodelist[0].pos if use_env else 0,
@@ -492,8 +519,4 @@ def get_surrounding_envs(document: STeXDocument, offset: int) -> list[LatexEnvir
     """
     Returns the surrounding environments of the given offset in the document.
     """
-    return [
-        node
-        for node in iterate_latex_nodes(document.get_latex_walker().get_latex_nodes()[0])
-        if isinstance(node, LatexEnvironmentNode) and node.pos <= offset < node.pos + node.len
-    ]
+    return document.get_environment_index().get_surrounding_envs(offset)
@@ -1,11 +1,15 @@
 import re
-from typing import TypeVar, Generic, Iterable, Optional, Hashable
+from collections import defaultdict
+from typing import TypeVar, Generic, Iterable, Optional, Hashable, AbstractSet
 
-from ffutil.snify.stemming import string_to_stemmed_word_sequence_simplified, string_to_stemmed_word_sequence
+from ffutil.snify.stemming import string_to_stemmed_word_sequence_simplified, string_to_stemmed_word_sequence, \
+    string_to_stemmed_word_sequence_simplified_batch
 from ffutil.utils.linked_str import LinkedStr, string_to_lstr
 
 
 class Verbalization:
+    __slots__ = 'verb',
+
     def __init__(self, verb: str):
         self.verb = verb
 
@@ -14,18 +18,32 @@ Symb = TypeVar('Symb', bound=Hashable)
 Verb = TypeVar('Verb', bound=Verbalization)
 
 
+_WHITESPACE_REGEX = re.compile(r'\s+')
+_NO_IGNORES: frozenset = frozenset()
+
+# shared by all trie nodes that do not have children/verbalizations (must never be modified)
+_EMPTY: dict = {}
+
+
 class Trie(Generic[Symb, Verb]):
     __slots__ = 'verbs', 'children'
     def __init__(self):
-        self.children: dict[str, 'Trie[Symb, Verb]'] = {}
-        self.verbs: dict[Symb, list[Verb]] = {}
+        # most nodes either have no children or no verbalizations,
+        # so the dicts are only created when needed (the tries have very many nodes)
+        self.children: dict[str, 'Trie[Symb, Verb]'] = _EMPTY
+        self.verbs: dict[Symb, list[Verb]] = _EMPTY
 
     def insert(self, key: Iterable[str], symb: Symb, verb: Verb):
         node = self
         for k in key:
             if k not in node.children:
-                node.children[k] = Trie[Symb, Verb]()
+                if node.children is _EMPTY:
+                    node.children = {}
+                # Trie[Symb, Verb]() would be noticeably slower
+                node.children[k] = Trie()
             node = node.children[k]
+        if node.verbs is _EMPTY:
+            node.verbs = {}
         node.verbs.setdefault(symb, []).append(verb)
 
     def get(self, key: Iterable[str]) -> dict[Symb, list[Verb]]:
@@ -34,7 +52,7 @@ class Trie(Generic[Symb, Verb]):
             if k not in node.children:
                 return {}
             node = node.children[k]
-        return node.verbs
+        return node.verbs if node.verbs is not _EMPTY else {}   # never hand out the shared _EMPTY
 
     def __contains__(self, item):
         return item in self.verbs
@@ -51,8 +69,7 @@ class Catalog(Generic[Symb, Verb]):
         self.trie = Trie[Symb, Verb]()
         self.symb_to_verb = {}
         if symbverbs is not None:
-            for symb, verb in symbverbs:
-                self.add_symbverb(symb, verb)
+            self._bulk_insert(symbverbs)
 
     def symb_iter(self) -> Iterable[Symb]:
         yield from self.symb_to_verb.keys()
@@ -62,6 +79,14 @@ class Catalog(Generic[Symb, Verb]):
         key = string_to_stemmed_word_sequence_simplified(verb.verb, self.lang)
         self.trie.insert(key, symb, verb)
 
+    def _bulk_insert(self, symbverbs: Iterable[tuple[Symb, Verb]]):
+        """ like add_symbverb for many entries (the stem keys are computed in one go) """
+        symbverbs = list(symbverbs)
+        keys = string_to_stemmed_word_sequence_simplified_batch([verb.verb for _, verb in symbverbs], self.lang)
+        for (symb, verb), key in zip(symbverbs, keys):
+            self.symb_to_verb.setdefault(symb, []).append(verb)
+            self.trie.insert(key, symb, verb)
+
     def add_symb(self, symb: Symb):
         """ Add a symbol, that may not have a verbalization. """
         self.symb_to_verb.setdefault(symb, [])
@@ -79,9 +104,9 @@ class Catalog(Generic[Symb, Verb]):
     def find_first_match(
             self,
             string: str,
-            stems_to_ignore: Optional[set[str]] = None,
-            words_to_ignore: Optional[set[str]] = None,
-            symbols_to_ignore: Optional[set[Symb]] = None,
+            stems_to_ignore: Optional[AbstractSet[str]] = None,
+            words_to_ignore: Optional[AbstractSet[str]] = None,
+            symbols_to_ignore: Optional[AbstractSet[Symb]] = None,
     ) -> Optional[tuple[int, int, list[tuple[Symb, Verb]]]]:
         """ returns (start_index, end_index, [(symbol, example verb), ...])
         for the match with the lowest start_index and highest end_index
@@ -93,36 +118,42 @@ class Catalog(Generic[Symb, Verb]):
 
         lstr = string_to_lstr(string)
         seq: list[LinkedStr] = string_to_stemmed_word_sequence(lstr, self.lang)
-        match_start = 0
-
-        while match_start < len(seq):
+        # the linked strings are only needed for their strings and references (computed once instead of per lookup)
+        words = [str(w) for w in seq]
+        start_refs = [w.get_start_ref() for w in seq]
+        end_refs = [w.get_end_ref() for w in seq]
+        words_to_ignore = words_to_ignore or _NO_IGNORES
+        stems_to_ignore = stems_to_ignore or _NO_IGNORES
+        symbols_to_ignore = symbols_to_ignore or _NO_IGNORES
+        n = len(words)
+
+        for match_start in range(n):
             j = match_start
             trie = self.trie
 
             # the result will be set whenever a match is found
             # longer matches will overwrite previous ones
             result: Optional[tuple[int, int, list[tuple[Symb, Verb]]]] = None
-            while j < len(seq) and str(seq[j]) in trie.children:
-                trie = trie.children[str(seq[j])]
+            while j < n and (child := trie.children.get(words[j])) is not None:
+                trie = child
                 if trie.verbs:      # potential match
                     is_valid_match = True
-                    original_word = string[seq[match_start].get_start_ref():seq[j].get_end_ref()]
-                    original_word = re.sub(r'\s+', ' ', original_word)
-                    if original_word in (words_to_ignore or ()):
-                        is_valid_match = False
-                    elif ' '.join(str(w) for w in seq[match_start:j + 1]) in (stems_to_ignore or ()):
-                        is_valid_match = False
+                    if words_to_ignore:
+                        original_word = _WHITESPACE_REGEX.sub(' ', string[start_refs[match_start]:end_refs[j]])
+                        is_valid_match = original_word not in words_to_ignore
+                    if is_valid_match and stems_to_ignore:
+                        is_valid_match = ' '.join(words[match_start:j + 1]) not in stems_to_ignore
 
                     if is_valid_match:
                         symbols = [
                             (symb, verbs[0])
                             for symb, verbs in trie.verbs.items()
-                            if symb not in (symbols_to_ignore or ())
+                            if symb not in symbols_to_ignore
                         ]
                         if symbols:
                             result = (
-                                seq[match_start].get_start_ref(),
-                                seq[j].get_end_ref(),
+                                start_refs[match_start],
+                                end_refs[j],
                                 symbols
                             )
                 j += 1
@@ -130,8 +161,6 @@ class Catalog(Generic[Symb, Verb]):
             if result is not None:
                 return result
 
-            match_start += 1
-
         return None    # no match found
 
 
@@ -139,11 +168,16 @@ def catalogs_from_stream(
         stream: Iterable[tuple[str, Symb, Verb]],
         symbols: Iterable[Symb] = (),
     ) -> dict[str, Catalog[Symb, Verb]]:
-    catalogs: dict[str, Catalog[Symb, Verb]] = {}
+    buckets: defaultdict[str, list[tuple[Symb, Verb]]] = defaultdict(list)
     for lang, symb, verb in stream:
-        if lang not in catalogs:
-            catalogs[lang] = Catalog[Symb, Verb](lang)
-            for symbol in symbols:
-                catalogs[lang].add_symb(symbol)
-        catalogs[lang].add_symbverb(symb, verb)
+        buckets[lang].append((symb, verb))
+
+    symbols = list(symbols)   # needed for every language
+    catalogs: dict[str, Catalog[Symb, Verb]] = {}
+    for lang, symbverbs in buckets.items():
+        catalog = Catalog[Symb, Verb](lang)
+        for symbol in symbols:
+            catalog.add_symb(symbol)
+        catalog._bulk_insert(symbverbs)
+        catalogs[lang] = catalog
     return catalogs
\ No newline at end of file
@@ -10,37 +10,62 @@ import dataclasses
 import gzip
 import logging
 import os
-from typing import TypeAlias, Iterable
+import sys
+from typing import TypeAlias, Iterable, Optional
 
 import orjson
 
 from ffutil.config import CACHE_DIR
 from ffutil.snify.catalog import Verbalization, Catalog, catalogs_from_stream
-from ffutil.stex.local_stex import OpenedStexFLAMSFile, lang_from_path
+from ffutil.stex.local_stex import OpenedStexFLAMSFile, lang_from_path, FlamsUri
 from ffutil.stex.flams import FLAMS
 from ffutil.utils.timer import timelogger
 
 logger = logging.getLogger(__name__)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True, eq=False)
 class LocalStexSymbol:
     uri: str
     path: str
     srefcount: int = 0   # simple heuristic: the more references, the more relevant
+    _hash: int = dataclasses.field(init=False, repr=False)
+    _module_uri: Optional[str] = dataclasses.field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        # the same uris/paths occur for many verbalizations -> interning saves memory and speeds up comparisons
+        self.uri = sys.intern(self.uri)
+        self.path = sys.intern(self.path)
+        # symbols are looked up in dicts/sets a lot, so we compute the hash only once
+        self._hash = hash((self.uri, self.path))
+
+    @property
+    def module_uri(self) -> str:
+        """ uri of the module that contains the symbol (computed lazily, as few symbols are ever displayed) """
+        if self._module_uri is None:
+            uri = FlamsUri(self.uri)
+            uri.symbol = None
+            self._module_uri = str(uri)
+        return self._module_uri
 
     # TODO: symbols have to be hashable... the following is not ideal though
     def __eq__(self, other):
-        return (
+        return self is other or (
                 isinstance(other, LocalStexSymbol) and
                 self.uri == other.uri and self.path == other.path
         )
 
     def __hash__(self):
-        return hash((self.uri, self.path))
+        return self._hash
+
+    def __reduce__(self):
+        # string hashes differ between processes, so _hash must be recomputed when unpickling
+        return LocalStexSymbol, (self.uri, self.path, self.srefcount)
 
 
 class LocalStexVerbalization(Verbalization):
+    __slots__ = 'local_path', 'path_range'
+
     def __init__(self, verb: str, local_path: str, path_range: tuple[int, int]):
         super().__init__(verb)
         self.local_path = local_path
@@ -57,35 +82,39 @@ class LocalStexVerbalization(Verbalization):
 RawVerbEntry: TypeAlias = tuple[str, str, str, str, int, int]
 
 
-def _verb_and_symb_extraction(j, opened_file: OpenedStexFLAMSFile) -> Iterable[RawVerbEntry | str]:
+# annotation keys that cannot contain anything relevant for the extraction
+# TODO: add more keys to filter (optimization)
+_SKIP_KEYS = frozenset({
+    'full_range', 'val_range', 'key_range', 'Sig', 'smodule_range', 'Title', 'path_range', 'archive_range', 'UseModule'
+})
+# annotation keys of symbol (or structure) definitions/declarations
+_SYMBOL_KEYS = frozenset({'Symdef', 'Symdecl', 'MathStructure'})
+# annotation keys of verbalizations
+_VERB_KEYS = frozenset({'Symref', 'SymName'})
+
+
+def _verb_and_symb_extraction(j, opened_file: OpenedStexFLAMSFile, lang: str) -> Iterable[RawVerbEntry | str]:
     """ recurse through the annotation json to find symrefs and co.
     It yields verbalizations (RawVerbEntry) and symbols (str) if they are defined/declared.
+    lang is the language of opened_file (passed along to avoid recomputing it for every verbalization).
     """
     if isinstance(j, dict):
         for k, v in j.items():
-            # TODO: add more keys to filter (optimization)
-            if k in {'full_range', 'val_range', 'key_range', 'Sig', 'smodule_range', 'Title', 'path_range',
-                     'archive_range', 'UseModule'}:
+            if k in _SKIP_KEYS:
                 continue
-            if k in {'Symdef', 'Symdecl'}:
-                yield v['uri']['uri']
-            if k in {'MathStructure'}:
+            if k in _SYMBOL_KEYS:
                 yield v['uri']['uri']
-            if k in {'Symref', 'SymName'}:
+            if k in _VERB_KEYS:
                 # symbol = _get_symbol(v['uri'][0]['uri'], v['uri'][0]['filepath'])
                 if k == 'Symref':
                     range_ = opened_file.flams_range_to_offsets(v['text'][0])
-                    verb = opened_file.text[range_[0]:range_[1]]
-                    verb = verb[1:-1]  # remove braces
+                    verb = opened_file.text[range_[0] + 1:range_[1] - 1]  # without braces
                 else:
                     range_ = opened_file.flams_range_to_offsets(v['name_range'])
-                    verb = opened_file.text[range_[0]:range_[1]]
-                    if '?' in verb:
-                        verb = verb.split('?')[-1]
+                    verb = opened_file.text[range_[0]:range_[1]].rpartition('?')[2]
                     # TODO: For \Sn{edge}, we'd now have the verbalization "edge", not "Edge"
                     #  is this desirable?
 
-                lang = lang_from_path(opened_file.path)
                 symbol_uri: str = v['uri'][0]['uri']
                 symbol_path: str = v['uri'][0]['filepath']
                 yield (
@@ -98,26 +127,37 @@ def _verb_and_symb_extraction(j, opened_file: OpenedStexFLAMSFile) -> Iterable[R
                 )
                 continue
 
-            yield from _verb_and_symb_extraction(v, opened_file)
+            if isinstance(v, (dict, list)):   # no need to create a generator for leaves
+                yield from _verb_and_symb_extraction(v, opened_file, lang)
 
     elif isinstance(j, list):
         for item in j:
-            yield from _verb_and_symb_extraction(item, opened_file)
+            if isinstance(item, (dict, list)):
+                yield from _verb_and_symb_extraction(item, opened_file, lang)
 
 
 CACHE_FILE = CACHE_DIR / 'local_stex_catalog.json.gz'
 # cache file structure:
-# filename -> { 'last_modified': timestamp, 'entries': [RawVerbEntry, ...] }
+# filename -> { 'fingerprint': [mtime_ns, size], 'verbs': [RawVerbEntry, ...], 'symbols': [symbol uri, ...] }
 
 
-# def local_flams_stex_verbs() -> Iterable[RawVerbEntry]:
-#     # The main extraction loop
-#     FLAMS.require_all_files_loaded()
-#     for path in FLAMS.get_loaded_files():
-#
-#         annos = FLAMS.get_file_annotations(path)
-#
-#         yield from _verb_extraction(annos, VerbExtractionCtx(path, OpenedFile(path)))
+def _fingerprint(path: str) -> list[int]:
+    """ identifies the version of a file (a list, as that's what we get back from the json cache) """
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _extract_file(path: str) -> dict:
+    """ returns the cache entry for a file """
+    fingerprint = _fingerprint(path)   # before reading the file, so that later changes are not missed
+    annos = FLAMS.get_file_annotations(path)
+    entries = list(_verb_and_symb_extraction(annos, OpenedStexFLAMSFile(path), lang_from_path(path)))
+    return {
+        'fingerprint': fingerprint,
+        'verbs': [entry for entry in entries if isinstance(entry, tuple)],
+        'symbols': [entry for entry in entries if isinstance(entry, str)],
+    }
+
 
 LocalFlamsCatalog: TypeAlias = Catalog[LocalStexSymbol, LocalStexVerbalization]
 
@@ -138,7 +178,8 @@ def local_flams_stex_catalogs() -> dict[str, LocalFlamsCatalog]:
         all_files_set = set(all_files)
         for path, entry in list(cache.items()):
             # if modification time check is slow, it can be parallelized
-            if path not in all_files_set or entry['last_modified'] < os.stat(path).st_mtime:
+            # entries from older cache versions have no fingerprint and get discarded
+            if path not in all_files_set or entry.get('fingerprint') != _fingerprint(path):
                 deletions += 1
                 del cache[path]
 
@@ -147,14 +188,9 @@ def local_flams_stex_catalogs() -> dict[str, LocalFlamsCatalog]:
     logger.info(f'Kept {len(cache)} entries in cache ({deletions} entries deleted); {len(todo_list)} files to process')
 
     with timelogger(logger, 'Extracting local sTeX verbalizations with FLAMS'):
+        # serial: FLAMS is not known to be safe to call concurrently (and most of the work holds the GIL anyway)
         for path in todo_list:
-            annos = FLAMS.get_file_annotations(path)
-            verbs_and_symbols = _verb_and_symb_extraction(annos, OpenedStexFLAMSFile(path))
-            cache[path] = {
-                'last_modified': os.stat(path).st_mtime,
-                'verbs': [entry for entry in verbs_and_symbols if isinstance(entry, tuple)],
-                'symbols': [symbol for symbol in verbs_and_symbols if isinstance(entry, str)],
-            }
+            cache[path] = _extract_file(path)
 
     if deletions + len(todo_list) > 100:
         with timelogger(logger, f'Saving local sTeX verbalizations to {CACHE_FILE}'):
@@ -162,26 +198,27 @@ def local_flams_stex_catalogs() -> dict[str, LocalFlamsCatalog]:
                 f.write(orjson.dumps(cache))
 
     _symbols: dict[tuple[str, str], LocalStexSymbol] = {}
-    def get_symbol(uri: str, path: str) -> LocalStexSymbol:
+    def get_symbol(uri: str, path: str, is_reference: bool = True) -> LocalStexSymbol:
         key = (uri, path)
         if key not in _symbols:
             _symbols[key] = LocalStexSymbol(uri=uri, path=path)
         symbol = _symbols[key]
-        symbol.srefcount += 1
+        if is_reference:
+            symbol.srefcount += 1
         return symbol
 
     with timelogger(logger, 'Building catalogs'):
         return catalogs_from_stream(
             (
-                (lang, get_symbol(uri, path), LocalStexVerbalization(verb, path, (start, end)))
+                (lang, get_symbol(uri, symb_path), LocalStexVerbalization(verb, path, (start, end)))
                 for path, entry in cache.items()
-                for lang, uri, path, verb, start, end in entry['verbs']
+                for lang, uri, symb_path, verb, start, end in entry['verbs']
             ),
-            (
-                symb
-                for entry in cache.values()
-                for symb in entry['symbols']
-            )
+            [   # a list, as it is needed for every language
+                get_symbol(uri, path, is_reference=False)
+                for path, entry in cache.items()
+                for uri in entry['symbols']
+            ]
         )
 
 
@@ -1,4 +1,3 @@
-from copy import deepcopy
 from pathlib import Path
 from typing import Sequence, Any
 
@@ -129,16 +128,18 @@ class StemFocusCommand(Command):
     def execute(self, call: str) -> Sequence[CommandOutcome]:
         state = self.stepper.state
         assert isinstance(state, SnifyState)
-        new_state = deepcopy(state)   # TODO: This is inefficient (copies and then discards entire stack)
-        new_state.on_unfocus = None
-        new_state.documents = [state.get_current_document()]
-        new_state.stem_focus = mystem(state.get_selected_text(), state.get_current_document().language)
-        new_state.focus_lang = state.get_current_document().language
+        new_state = state.shallow_copy_with(
+            on_unfocus=None,
+            documents=[state.get_current_document()],
+            stem_focus=mystem(state.get_selected_text(), state.get_current_document().language),
+            focus_lang=state.get_current_document().language,
+        )
 
         return [
             # do not want to return to old selection
             FocusOutcome(new_state, self.stepper),
-            SetCursorOutcome(SnifyCursor(state.cursor.document_index, state.cursor.selection[0])),
+            # the focussed state only has the current document
+            SetCursorOutcome(SnifyCursor(0, state.cursor.selection[0])),
         ]
 
 
@@ -156,10 +157,11 @@ class StemFocusCommandPlus(Command):
     def execute(self, call: str) -> Sequence[CommandOutcome]:
         state = self.stepper.state
         assert isinstance(state, SnifyState)
-        new_state = deepcopy(state)   # TODO: This is inefficient (copies and then discards entire stack)
-        new_state.on_unfocus = None
-        new_state.stem_focus = mystem(state.get_selected_text(), state.get_current_document().language)
-        new_state.focus_lang = state.get_current_document().language
+        new_state = state.shallow_copy_with(
+            on_unfocus=None,
+            stem_focus=mystem(state.get_selected_text(), state.get_current_document().language),
+            focus_lang=state.get_current_document().language,
+        )
 
         return [
             FocusOutcome(new_state, self.stepper),
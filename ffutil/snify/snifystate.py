@@ -1,3 +1,4 @@
+import copy
 import dataclasses
 from typing import Optional
 
@@ -26,12 +27,30 @@ class SnifyState(DocumentStepperState, FocussableState, State[SnifyCursor]):
         self.stem_focus: Optional[str] = None   # only suggest annotations for this stem (used in focus mode)
         self.focus_lang: Optional[str] = None  # only annotate documents of this language (used in focus mode)
 
+    def shallow_copy_with(self, **overrides) -> 'SnifyState':
+        """ Returns a copy of the state with the given attributes replaced.
+
+        Everything is shared with this state (in particular the documents),
+        except for the skip sets, which get copied so that skips in the copy do not affect this state.
+        """
+        new_state = copy.copy(self)
+        new_state.skip_stem_by_docid = {k: set(v) for k, v in self.skip_stem_by_docid.items()}
+        new_state.skip_by_docid = {k: set(v) for k, v in self.skip_by_docid.items()}
+        new_state.skip_stem = {k: set(v) for k, v in self.skip_stem.items()}
+        new_state.skip = {k: set(v) for k, v in self.skip.items()}
+        for attr, value in overrides.items():
+            if not hasattr(new_state, attr):
+                raise AttributeError(f'SnifyState has no attribute {attr!r}')
+            setattr(new_state, attr, value)
+        return new_state
+
     def get_skip_words(self, lang: str, doc_index: Optional[int] = None):
         from ffutil.snify.skip_and_ignore import get_srskipped_cached, IgnoreList
 
         tmp_skip = self.skip.get(lang, set())
         tmp_doc_skip = self.skip_by_docid.get((lang, doc_index), set()) if doc_index is not None else set()
-        srskipped = get_srskipped_cached(self.get_current_document().get_content()).skipped_literal
+        document = self.documents[doc_index] if doc_index is not None else self.get_current_document()
+        srskipped = get_srskipped_cached(document.get_content()).skipped_literal
         return (
             tmp_skip
             | tmp_doc_skip
@@ -45,7 +64,8 @@ class SnifyState(DocumentStepperState, FocussableState, State[SnifyCursor]):
 
         tmp_skip = self.skip_stem.get(lang, set())
         tmp_doc_skip = self.skip_stem_by_docid.get((lang, doc_index), set()) if doc_index is not None else set()
-        srskipped = get_srskipped_cached(self.get_current_document().get_content()).skipped_stems
+        document = self.documents[doc_index] if doc_index is not None else self.get_current_document()
+        srskipped = get_srskipped_cached(document.get_content()).skipped_stems
         return (
             tmp_skip
             | tmp_doc_skip
@@ -1,4 +1,6 @@
 import functools
+import logging
+import math
 from typing import Optional, Any
 
 from ffutil.snify.annotate import STeXAnnotateCommand, STeXLookupCommand
@@ -16,8 +18,13 @@ from ffutil.stepper.document import STeXDocument, Document
 from ffutil.stepper.document_stepper import DocumentModifyingStepper
 from ffutil.stepper.interface import interface
 from ffutil.stepper.stepper import Stepper, StopStepper, Modification
+from ffutil.stex.local_stex import clear_import_caches
 from ffutil.stepper.stepper_extensions import QuittableStepper, QuitCommand, CursorModifyingStepper, UndoCommand, \
-    RedoCommand, UndoableStepper
+    RedoCommand, UndoableStepper, CursorModification
+
+logger = logging.getLogger(__name__)
+
+_EMPTY: frozenset = frozenset()
 
 
 class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingStepper, UndoableStepper, Stepper[SnifyState]):
@@ -25,37 +32,47 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
         super().__init__(state)
         self.state = state
         self.current_annotation_choices: Optional[list[tuple[Any, Verbalization]]] = None
+        self._reported_missing_catalogs: set[str] = set()   # languages
+        # document identifier -> offset from which on the document has nothing to annotate
+        # (only valid as long as neither the state nor anything that affects the matches changes)
+        self._exhausted_from: dict[str, int] = {}
+        # creating the commands can be expensive (e.g. the annotation command collects import information),
+        # so the command collection is re-used if nothing changed (e.g. after showing the help)
+        self._modification_count: int = 0
+        self._command_collection_cache: Optional[tuple[tuple, CommandCollection]] = None
 
     @functools.cache
     def get_stex_catalogs(self) -> dict[str, LocalFlamsCatalog]:
         return local_flams_stex_catalogs()
 
+    @functools.cache
+    def _get_stex_catalog(self, lang: str, stem_focus: Optional[str]) -> Optional[Catalog]:
+        """ cached as this is needed for every cursor step (and sub-catalogs are expensive to create) """
+        catalog = self.get_stex_catalogs().get(lang)
+        if catalog is not None and stem_focus:
+            catalog = catalog.sub_catalog_for_stem(stem_focus)
+        return catalog
+
     def get_catalog_for_document(self, doc: Document) -> Optional[LocalFlamsCatalog]:
-        error_message: Optional[str] = None
-        catalog: Optional[Catalog] = None
+        if not isinstance(doc, STeXDocument):
+            raise ValueError(f'Unsupported document type {type(doc)}')
 
-        if isinstance(doc, STeXDocument):
-            catalogs = self.get_stex_catalogs()
-            if not catalogs:
+        catalog = self._get_stex_catalog(doc.language, self.state.stem_focus)
+        if catalog is None and doc.language not in self._reported_missing_catalogs:
+            # only report once per language (otherwise, the user would have to confirm it for every document)
+            self._reported_missing_catalogs.add(doc.language)
+            if not self.get_stex_catalogs():
                 error_message = (
                     f'Error when processing {doc.identifier}:\n'
                     'No STeX catalogs available.'
                 )
-            elif doc.language not in catalogs:
+            else:
                 error_message = (
                     f'Error when processing {doc.identifier}:\n'
-                    'No STeX catalogs available for language {doc.language}.'
+                    f'No STeX catalogs available for language {doc.language}.'
                 )
-            else:
-                catalog = catalogs[doc.language]
-        else:
-            raise ValueError(f'Unsupported document type {type(doc)}')
-
-        if error_message:
             interface.write_text(error_message, style='error')
             interface.await_confirmation()
-        if self.state.stem_focus:
-            catalog = catalog.sub_catalog_for_stem(self.state.stem_focus)
         return catalog
 
     def get_catalog_for_current_document(self) -> Optional[LocalFlamsCatalog]:
@@ -77,7 +94,7 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
                 string=doc.get_content()[cursor.selection[0]:cursor.selection[1]],
                 stems_to_ignore=self.state.get_skip_stems(doc.language, cursor.document_index),
                 words_to_ignore=self.state.get_skip_words(doc.language, cursor.document_index),
-                symbols_to_ignore=set(),
+                symbols_to_ignore=_EMPTY,
             )
             if first_match is None:
                 self.current_annotation_choices = []
@@ -86,33 +103,42 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
                 self.current_annotation_choices = options
             return
 
-        while cursor.document_index < len(self.state.documents):
-            doc = self.state.documents[cursor.document_index]
-            if self.state.focus_lang is not None and doc.language != self.state.focus_lang:
+        state = self.state
+        documents = state.documents
+        focus_lang = state.focus_lang
+        while cursor.document_index < len(documents):
+            doc_index = cursor.document_index
+            doc = documents[doc_index]
+            if focus_lang is not None and doc.language != focus_lang:
                 # document has wrong language
-                cursor = SnifyCursor(cursor.document_index + 1, 0)
+                cursor = SnifyCursor(doc_index + 1, 0)
+                continue
+            if cursor.selection >= self._exhausted_from.get(doc.identifier, math.inf):
+                # we already know that there is nothing left to annotate
+                cursor = SnifyCursor(doc_index + 1, 0)
                 continue
 
-            print(f'Processing document {doc.identifier} at index {cursor.document_index}...')
-            annotatable_segments = doc.get_annotatable_plaintext()
-
+            logger.debug('Processing document %s at index %d', doc.identifier, doc_index)
             catalog = self.get_catalog_for_document(doc)
             if catalog is None:
-                cursor = SnifyCursor(cursor.document_index + 1, 0)
+                cursor = SnifyCursor(doc_index + 1, 0)
                 continue
 
-            for segment in annotatable_segments:
-                if segment.get_end_ref() <= cursor.selection:
-                    continue  # segment is before cursor
+            # the same for all segments of the document
+            find_first_match = catalog.find_first_match
+            stems_to_ignore = state.get_skip_stems(doc.language, doc_index)
+            words_to_ignore = state.get_skip_words(doc.language, doc_index)
+            selection = cursor.selection
 
-                if cursor.selection >= segment.get_start_ref():
-                    segment = segment[segment.get_indices_from_ref_range(cursor.selection, segment.get_end_ref())[0]:]
+            for segment in doc.get_annotatable_plaintext_from(selection):
+                if selection >= segment.get_start_ref():
+                    segment = segment[segment.get_indices_from_ref_range(selection, segment.get_end_ref())[0]:]
 
-                first_match = catalog.find_first_match(
+                first_match = find_first_match(
                     string=str(segment),
-                    stems_to_ignore=self.state.get_skip_stems(doc.language, cursor.document_index),
-                    words_to_ignore=self.state.get_skip_words(doc.language, cursor.document_index),
-                    symbols_to_ignore=set(),
+                    stems_to_ignore=stems_to_ignore,
+                    words_to_ignore=words_to_ignore,
+                    symbols_to_ignore=_EMPTY,
                 )
 
                 if first_match is None:
@@ -121,14 +147,15 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
                 start, stop, options = first_match
                 subsegment = segment[start:stop]
                 self.current_annotation_choices = options
-                self.state.cursor = SnifyCursor(
-                    cursor.document_index,
+                state.cursor = SnifyCursor(
+                    doc_index,
                     selection=(subsegment.get_start_ref(), subsegment.get_end_ref())
                 )
                 return
 
             # nothing found in this document; move to the next one
-            cursor = SnifyCursor(cursor.document_index + 1, 0)
+            self._exhausted_from[doc.identifier] = selection
+            cursor = SnifyCursor(doc_index + 1, 0)
 
         interface.clear()
         interface.write_text('There is nothing left to annotate.\n')
@@ -136,6 +163,7 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
             interface.write_text('Ending focus mode.\n')
             interface.await_confirmation()
             self.state = self.state.on_unfocus
+            self._exhausted_from.clear()
         else:
             interface.write_text('Quitting snify.\n')
             interface.await_confirmation()
@@ -160,7 +188,14 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
         catalog = self.get_catalog_for_current_document()
         document = self.state.get_current_document()
         assert catalog is not None
-        return CommandCollection(
+        key = (
+            self.state, self.state.cursor, catalog, self.current_annotation_choices,
+            self._modification_count, len(self.modification_history), len(self.modification_future),
+        )
+        if self._command_collection_cache is not None and self._command_collection_cache[0] == key:
+            return self._command_collection_cache[1]
+
+        command_collection = CommandCollection(
             'snify',
             [
                 QuitCommand(),
@@ -196,10 +231,24 @@ class SnifyStepper(DocumentModifyingStepper, QuittableStepper, CursorModifyingSt
             ],
             have_help=True
         )
+        self._command_collection_cache = (key, command_collection)
+        return command_collection
+
+    def reset_after_modification(self, modification: Modification, is_undone: bool = False):
+        super().reset_after_modification(modification, is_undone)
+        self._modification_count += 1
+        if not isinstance(modification, CursorModification):
+            # e.g. documents, skips or the state itself might have changed
+            self._exhausted_from.clear()
 
     def handle_command_outcome(self, outcome: CommandOutcome) -> Optional[Modification]:
         if isinstance(outcome, RescanOutcome):
             self.get_stex_catalogs.cache_clear()
+            self._get_stex_catalog.cache_clear()
+            self._reported_missing_catalogs.clear()
+            self._exhausted_from.clear()
+            self._command_collection_cache = None
+            clear_import_caches()
             return None
 
         return super().handle_command_outcome(outcome)
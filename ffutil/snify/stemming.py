@@ -1,6 +1,7 @@
 import functools
 import re
 from logging import getLogger
+from typing import Iterable
 
 from ffutil.utils.linked_str import LinkedStr
 from ffutil.utils.warnonce import warn_once
@@ -9,6 +10,8 @@ logger = getLogger(__name__)
 
 SUPPORTED_LANGUAGES = {'en', 'de', 'fr'}
 
+_WORD_REGEX = re.compile(r'\b\w+\b')
+
 
 @functools.cache
 def get_stem_fun(lang: str):
@@ -60,7 +63,10 @@ def string_to_stemmed_word_sequence(lstr: LinkedStr, lang: str) -> list[LinkedSt
 
 def string_to_stemmed_word_sequence_simplified(string: str, lang: str) -> list[str]:
     # same as above, but without linked strings (more efficient)
-    words: list[str] = []
-    for match in re.finditer(r'\b\w+\b', string):
-        words.append(mystem(match.group(), lang))
-    return words
+    return [mystem(word, lang) for word in _WORD_REGEX.findall(string)]
+
+
+def string_to_stemmed_word_sequence_simplified_batch(strings: Iterable[str], lang: str) -> list[list[str]]:
+    # same as above for many strings (e.g. when building a catalog) - avoids the per-call overhead
+    findall = _WORD_REGEX.findall
+    return [[mystem(word, lang) for word in findall(string)] for string in strings]
@@ -1,12 +1,14 @@
 import abc
+import bisect
 import dataclasses
 from pathlib import Path
 from typing import Iterable, Optional
 
-from pylatexenc.latexwalker import LatexWalker
+from pylatexenc.latexwalker import LatexWalker, LatexNode
 
-from ffutil.stex.local_stex import lang_from_path
-from ffutil.stex.stex_py_parsing import STEX_CONTEXT_DB, get_annotatable_plaintext, get_plaintext_approx
+from ffutil.stex.local_stex import lang_from_path, clear_import_caches
+from ffutil.stex.stex_py_parsing import get_annotatable_plaintext, get_plaintext_approx, EnvironmentIndex, \
+    make_latex_walker
 from ffutil.stex.flams import FLAMS
 from ffutil.utils.linked_str import LinkedStr
 
@@ -28,6 +30,10 @@ class Document(abc.ABC):
     def get_annotatable_plaintext(self) -> Iterable[LinkedStr[None]]:
         raise NotImplementedError()
 
+    def get_annotatable_plaintext_from(self, offset: int) -> Iterable[LinkedStr[None]]:
+        """ Like get_annotatable_plaintext, but without the segments that end before offset. """
+        return (segment for segment in self.get_annotatable_plaintext() if segment.get_end_ref() > offset)
+
     def get_plaintext_approximation(self) -> LinkedStr:
         raise NotImplementedError()
 
@@ -38,10 +44,20 @@ class Document(abc.ABC):
         return []
 
 
+# attributes of STeXDocument that cache things derived from the content
+_STEX_DOCUMENT_CACHES = (
+    '_latex_walker', '_latex_nodes', '_environment_index', '_annotatable_plaintext', '_annotatable_plaintext_ends'
+)
+
+
 class STeXDocument(Document):
     """ A local stex document. """
     _content: Optional[str] = None
     _latex_walker: Optional[LatexWalker] = None
+    _latex_nodes: Optional[list[LatexNode]] = None
+    _environment_index: Optional[EnvironmentIndex] = None
+    _annotatable_plaintext: Optional[list[LinkedStr[None]]] = None
+    _annotatable_plaintext_ends: Optional[list[int]] = None
 
     def __init__(self, path: Path, language: str):
         self.path = path
@@ -51,6 +67,13 @@ class STeXDocument(Document):
             language=language
         )
 
+    def __getstate__(self):
+        # the parse results can be recomputed and are large (documents are pickled when sessions are stored)
+        state = self.__dict__.copy()
+        for attr in _STEX_DOCUMENT_CACHES:
+            state.pop(attr, None)
+        return state
+
     def get_content(self) -> str:
         if self._content is None:
             self._content = self.path.read_text()
@@ -60,28 +83,55 @@ class STeXDocument(Document):
         self.write_content(content)
         self._latex_walker = None
         FLAMS.load_file(self.identifier)
+        clear_import_caches()
 
 
     def get_latex_walker(self) -> LatexWalker:
         """ Returns a LatexWalker for the document content. """
         if self._latex_walker is None:
             content = self.get_content()
-            self._latex_walker = LatexWalker(content, latex_context=STEX_CONTEXT_DB)
+            self._latex_walker = make_latex_walker(content)
         return self._latex_walker
 
+    def get_latex_nodes(self) -> list[LatexNode]:
+        """ Returns the top-level LaTeX nodes of the document (parsing is expensive, so they are cached). """
+        if self._latex_nodes is None:
+            self._latex_nodes = self.get_latex_walker().get_latex_nodes()[0]
+        return self._latex_nodes
+
+    def get_environment_index(self) -> EnvironmentIndex:
+        """ Returns an index of the LaTeX environments in the document (for fast lookups by offset). """
+        if self._environment_index is None:
+            self._environment_index = EnvironmentIndex(self.get_latex_nodes())
+        return self._environment_index
+
     def write_content(self, content: str) -> None:
         """ Writes the content to the file. """
         self.path.write_text(content)
         self._content = content
         self._latex_walker = None
-
-    def get_annotatable_plaintext(self) -> Iterable[LinkedStr[None]]:
-        return get_annotatable_plaintext(
-            self.get_latex_walker()
-        )
+        self._latex_nodes = None
+        self._environment_index = None
+        self._annotatable_plaintext = None
+        self._annotatable_plaintext_ends = None
+
+    def get_annotatable_plaintext(self) -> list[LinkedStr[None]]:
+        # cached as it is needed for every cursor step
+        if self._annotatable_plaintext is None:
+            self._annotatable_plaintext = get_annotatable_plaintext(
+                self.get_latex_walker(), nodes=self.get_latex_nodes()
+            )
+        return self._annotatable_plaintext
+
+    def get_annotatable_plaintext_from(self, offset: int) -> Iterable[LinkedStr[None]]:
+        # the segments are in document order -> binary search instead of a linear scan
+        segments = self.get_annotatable_plaintext()
+        if self._annotatable_plaintext_ends is None:
+            self._annotatable_plaintext_ends = [segment.get_end_ref() for segment in segments]
+        return segments[bisect.bisect_right(self._annotatable_plaintext_ends, offset):]
 
     def get_plaintext_approximation(self) -> LinkedStr:
-        return get_plaintext_approx(self.get_latex_walker())
+        return get_plaintext_approx(self.get_latex_walker(), nodes=self.get_latex_nodes())
 
 
 def documents_from_paths(
@@ -1,8 +1,10 @@
 """
 User interfaces for the stepper module.
 """
+import bisect
 import dataclasses
 import functools
+import itertools
 import shutil
 import subprocess
 from abc import ABC, abstractmethod
@@ -10,16 +12,19 @@ from contextlib import contextmanager
 from typing import Literal, Optional, TypeAlias, Callable, Any
 
 import click
-from pygments import highlight
-from pygments.formatters.terminal import TerminalFormatter
-from pygments.formatters.terminal256 import TerminalTrueColorFormatter
-from pygments.lexers.markup import TexLexer, MarkdownLexer
-
 from ffutil.config import get_config
 
 _Color: TypeAlias = str | tuple[int, int, int]
 
 
+@functools.lru_cache(maxsize=8)
+def _line_starts(text: str) -> list[int]:
+    """ offsets at which the lines of text start
+    (cached as the same document content tends to be displayed over and over again)
+    """
+    return [0, *itertools.accumulate(len(line) + 1 for line in text.split('\n'))][:-1]
+
+
 def _get_lines_around(text: str, start: int, end: int, n_lines: int = 7) -> tuple[str, str, str, int]:
     """
     returns
@@ -28,22 +33,49 @@ def _get_lines_around(text: str, start: int, end: int, n_lines: int = 7) -> tupl
       - the n_lines lines after the end index
       - the line number of the start index
     """
-    start_index = start
-    for _ in range(n_lines):
-        if start_index > 0:
-            start_index -= 1
-        while start_index > 0 and text[start_index - 1] != '\n':
-            start_index -= 1
+    # index arithmetic on the (cached) line starts instead of scanning the text
+    line_starts = _line_starts(text)
+
+    # the line containing the character before start and the n_lines - 1 lines before it
+    first_line = max(bisect.bisect_right(line_starts, start - 1) - n_lines, 0) if start > 0 else 0
+
+    if end + 1 >= len(text):
+        end_index = end + 1
+    else:
+        # up to the n_lines-th line break at or after end + 2
+        last_line = bisect.bisect_left(line_starts, end + 3) + n_lines - 1
+        end_index = line_starts[last_line] - 1 if last_line < len(line_starts) else len(text)
 
-    end_index = end
-    for _ in range(n_lines):
-        if end_index + 1 < len(text):
-            end_index += 1
-        while end_index + 1 < len(text) and text[end_index + 1] != '\n':
-            end_index += 1
-    end_index += 1
+    return text[line_starts[first_line]:start], text[start:end], text[end:end_index], first_line + 1
 
-    return text[start_index:start], text[start:end], text[end:end_index], text[:start_index].count('\n') + 1
+
+@functools.lru_cache
+def _get_lexer(format: Optional[str]):
+    """ lexers are stateless between calls, so one per format suffices """
+    # pygments is imported lazily as it takes a while (and isn't needed e.g. for the MinimalInterface)
+    from pygments.lexers.markup import TexLexer, MarkdownLexer
+    if format in {'tex', 'sTeX'}:
+        return TexLexer(stripnl=False, stripall=False, ensurenl=False)
+    if format == 'myst':
+        return MarkdownLexer(stripnl=False, stripall=False, ensurenl=False)
+    raise ValueError(f"Unknown format: {format!r}. Supported formats are 'tex', 'sTeX', and 'myst'.")
+
+
+@functools.lru_cache
+def _get_formatter(style: str, true_color: bool):
+    """ constructing a formatter resolves the whole style, so we only want to do it once """
+    if true_color:
+        from pygments.formatters.terminal256 import TerminalTrueColorFormatter
+        return TerminalTrueColorFormatter(style=style)
+    from pygments.formatters.terminal import TerminalFormatter
+    return TerminalFormatter(style=style)
+
+
+@functools.lru_cache(maxsize=64)
+def _highlight(code: str, format: Optional[str], style: str, true_color: bool) -> str:
+    """ cached as the same snippets get displayed repeatedly while stepping through a document """
+    from pygments import highlight
+    return highlight(code, _get_lexer(format), _get_formatter(style, true_color))
 
 
 class interface:
@@ -53,6 +85,10 @@ class interface:
     It has to stay synchronized with the abstract Interface class.
     An alternative would be to use __getattr__,
     but that would prevent static type checking.
+
+    The static methods below only declare the signatures:
+    set_interface replaces them with the bound methods of the actual interface,
+    which saves a forwarding call for every write.
     """
     @staticmethod
     def clear():
@@ -121,6 +157,11 @@ class interface:
         )
 
 
+_FORWARDED_METHODS: tuple[str, ...] = tuple(
+    name for name, value in vars(interface).items() if isinstance(value, staticmethod)
+)
+
+
 class Interface(ABC):
     """Base class for all interfaces in the stepper module."""
 
@@ -137,6 +178,11 @@ class Interface(ABC):
     def write_text(self, text: str, style: str = 'default', *, prestyled: bool = False):
         pass
 
+    @contextmanager
+    def batched_output(self):
+        """ Text written in this context may be buffered and emitted at the end in one go. """
+        yield
+
 
     def list_search(self, items: dict[str, Any] | list[str]) -> Optional[Any]:
         """
@@ -262,23 +308,38 @@ class Interface(ABC):
             limit_range: Optional[int] = None,    # only shows this many lines before/after the highlight_range
             show_line_numbers: bool = True,
     ):
+        """
+        Shows the code with the highlight_range highlighted.
+        Without limit_range, the whole code is shown.
+        """
         del format   # default implementation does no syntax highlighting
 
         a, b, c, line_no = self._code_highlight_prep(code, highlight_range, limit_range)
-        last_printed_line_no = None
-
-        for source, style in [(a, 'default'), (b, 'highlight'), (c, 'default')]:
-            for line_no, line in enumerate(source.splitlines(keepends=True), line_no):
-                if show_line_numbers and last_printed_line_no != line_no:
+        shown = a + b + c
+        highlight_start = len(a)
+        highlight_end = highlight_start + len(b)
+
+        with self.batched_output():
+            line_start = 0
+            for line_no, line in enumerate(shown.split('\n'), line_no):
+                line_end = line_start + len(line) + 1   # including the line break
+                if line_end > len(shown):    # last line (without line break)
+                    line_end = len(shown)
+                    if line_start == line_end:
+                        break
+                if show_line_numbers:
                     self.write_text(f'{line_no:4} ', style='pale')
-                    last_printed_line_no = line_no
-                self.write_text(line, style=style)
-
-            if source.endswith('\n'):
-                line_no += 1
-
-        if not code.endswith('\n'):
-            self.newline()
+                for start, end, style in [
+                    (line_start, min(line_end, highlight_start), 'default'),
+                    (max(line_start, highlight_start), min(line_end, highlight_end), 'highlight'),
+                    (max(line_start, highlight_end), line_end, 'default'),
+                ]:
+                    if start < end:
+                        self.write_text(shown[start:end], style=style)
+                line_start = line_end
+
+            if not code.endswith('\n'):
+                self.newline()
 
 class MinimalInterface(Interface):
     """A minimal interface that only prints text to the console."""
@@ -306,8 +367,16 @@ class ConsoleInterface(Interface):
     true_color: bool = False
 
     def __post_init__(self):
+        self._default_bg: _Color | None = None
+        self._default_fg: _Color | None = None
+        if self.true_color:
+            self._default_bg = (255, 255, 255) if self.light_mode else (0, 0, 0)
+            self._default_fg = (0, 0, 0) if self.light_mode else (255, 255, 255)
+        self._style_reset: str = click.style('', bg=self._default_bg, fg=self._default_fg, reset=False)
+        self._style_table: dict[str, tuple[str, str]] = {}   # style -> (opening codes, closing codes)
         self._in_big_infopage: bool = False
-        self._big_infopage_content: str = ''
+        self._big_infopage_chunks: list[str] = []   # joined at the end (repeated concatenation is quadratic)
+        self._batch: Optional[list[str]] = None     # see batched_output
 
     def clear(self) -> None:
         click.clear()
@@ -348,14 +417,31 @@ class ConsoleInterface(Interface):
         if self._in_big_infopage:
             raise RuntimeError("Already in a big infopage context.")
         self._in_big_infopage = True
-        self._big_infopage_content = ''
-        yield
-        self._in_big_infopage = False
-        click.echo_via_pager(self._big_infopage_content)
+        try:
+            yield
+        finally:   # do not get stuck in the infopage (and its buffered content) if something fails
+            self._in_big_infopage = False
+            content = ''.join(self._big_infopage_chunks)
+            self._big_infopage_chunks.clear()
+        click.echo_via_pager(content)
+
+    @contextmanager
+    def batched_output(self):
+        if self._batch is not None:   # already batching
+            yield
+            return
+        self._batch = []
+        try:
+            yield
+        finally:
+            batch, self._batch = self._batch, None
+            self._write_styled(''.join(batch))
 
     def _write_styled(self, text: str):
-        if self._in_big_infopage:
-            self._big_infopage_content += text
+        if self._batch is not None:
+            self._batch.append(text)
+        elif self._in_big_infopage:
+            self._big_infopage_chunks.append(text)
         else:
             click.echo(text, nl=False)
 
@@ -377,7 +463,8 @@ class ConsoleInterface(Interface):
         self.write_text(f'{text:^{self.width()}}', style=style)
         self.newline()
 
-    def apply_style(self, text: str, style: str) -> str:
+    def _get_style_params(self, style: str) -> dict[str, Any]:
+        """ the arguments for click.style """
         def c(
                 simple: str | None,
                 full: tuple[int, int, int],
@@ -391,10 +478,8 @@ class ConsoleInterface(Interface):
         bold = False
         italics = False
         strikethrough = False
-        default_bg = c(None, (0, 0, 0), None, (255, 255, 255))
-        default_fg = c(None, (255, 255, 255), None, (0, 0, 0))
-        bg = default_bg
-        fg = default_fg
+        bg = self._default_bg
+        fg = self._default_fg
 
         if style == 'bold':
             bold = True
@@ -419,8 +504,18 @@ class ConsoleInterface(Interface):
         else:
             pass
 
-        return click.style(text, bg=bg, fg=fg, bold=bold, italic=italics, strikethrough=strikethrough) + \
-            click.style('', bg=default_bg, fg=default_fg, reset=False)
+        return {'bg': bg, 'fg': fg, 'bold': bold, 'italic': italics, 'strikethrough': strikethrough}
+
+    def apply_style(self, text: str, style: str) -> str:
+        if style == 'default' and not self.true_color:
+            # the codes would only switch off attributes, but every styled text ends with a reset anyway
+            return text
+        # the codes only depend on the style (light_mode and true_color are fixed) -> memoized
+        codes = self._style_table.get(style)
+        if codes is None:
+            opening, closing = click.style('\x00', **self._get_style_params(style)).split('\x00')
+            codes = self._style_table[style] = (opening, closing + self._style_reset)
+        return codes[0] + text + codes[1]
 
 
     def get_input(self) -> str:
@@ -435,32 +530,30 @@ class ConsoleInterface(Interface):
             limit_range: Optional[int] = None,    # only shows this many lines before/after the highlight_range
             show_line_numbers: bool = True,
     ):
-        a, b, c, line_no = self._code_highlight_prep(code, highlight_range, limit_range)
-
-        def code_format(string: str) -> str:
-            style = 'vs' if self.light_mode else 'monokai'
-
-            if self.true_color:
-                formatter = TerminalTrueColorFormatter(style=style)
-            else:
-                formatter = TerminalFormatter(style=style)
+        """ Without limit_range, the whole code is syntax-highlighted, which takes time proportional to its length. """
+        if format is None:   # nothing to syntax-highlight
+            return super().show_code(
+                code, highlight_range=highlight_range, limit_range=limit_range, show_line_numbers=show_line_numbers
+            )
 
-            if format in {'tex', 'sTeX'}:
-                lexer = TexLexer(stripnl=False, stripall=False, ensurenl=False)
-            elif format == 'myst':
-                lexer = MarkdownLexer(stripnl=False, stripall=False, ensurenl=False)
-            else:
-                raise ValueError(f"Unknown format: {format!r}. Supported formats are 'tex', 'sTeX', and 'myst'.")
+        a, b, c, line_no = self._code_highlight_prep(code, highlight_range, limit_range)
 
-            return highlight(string, lexer, formatter)
+        style = 'vs' if self.light_mode else 'monokai'
+        formatted_code = (
+            _highlight(a, format, style, self.true_color) +
+            self.apply_style(b, 'highlight') +
+            _highlight(c, format, style, self.true_color)
+        )
 
-        formatted_code = code_format(a) + self.apply_style(b, 'highlight') + code_format(c)
+        # the style codes around the line numbers are the same for every line
+        pale_open, pale_close = self.apply_style('\x00', 'pale').split('\x00')
 
-        for i, line in enumerate(formatted_code.splitlines(keepends=True), line_no):
-            self.write_text(f'{i:4} ', style='pale')
-            self.write_text(line, prestyled=True)
+        with self.batched_output():   # a single click.echo for the whole block
+            for i, line in enumerate(formatted_code.splitlines(keepends=True), line_no):
+                self.write_text(f'{pale_open}{i:4} {pale_close}', prestyled=True)
+                self.write_text(line, prestyled=True)
 
-        interface.newline()
+            interface.newline()
 
     def await_confirmation(self):
         self.write_text('Press Enter to continue...', style='default')
@@ -489,25 +582,38 @@ For now, I'll continue without fzf.
 
 
 
-actual_interface: Interface = MinimalInterface()
+def _install(new_interface: Interface):
+    global actual_interface
+    actual_interface = new_interface
+    for name in _FORWARDED_METHODS:
+        setattr(interface, name, getattr(new_interface, name))
+
+
+actual_interface: Interface
+_install(MinimalInterface())
 
 DEFAULT_INTERFACES: dict[str, Callable[[], Interface]] = {
-    'console-debug': lambda: MinimalInterface(),
-    'console-dark': lambda: ConsoleInterface(light_mode=False, true_color=False),
-    'console-light': lambda: ConsoleInterface(light_mode=True, true_color=False),
-    'console-true-dark': lambda: ConsoleInterface(light_mode=True, true_color=True),
-    'console-true-light': lambda: ConsoleInterface(light_mode=True, true_color=True),
+    'console-debug': MinimalInterface,
+    'console-dark': functools.partial(ConsoleInterface, light_mode=False, true_color=False),
+    'console-light': functools.partial(ConsoleInterface, light_mode=True, true_color=False),
+    'console-true-dark': functools.partial(ConsoleInterface, light_mode=False, true_color=True),
+    'console-true-light': functools.partial(ConsoleInterface, light_mode=True, true_color=True),
 }
 
-def set_interface(new_interface: Interface | str):
-    global actual_interface
 
+@functools.cache
+def _make_interface(name: str) -> Interface:
+    """ the default interfaces are only created once (setting one up again is then free) """
+    if name not in DEFAULT_INTERFACES:
+        raise ValueError(f'Unknown interface name: {name!r}')
+    return DEFAULT_INTERFACES[name]()
+
+
+def set_interface(new_interface: Interface | str):
     if isinstance(new_interface, str):
-        if new_interface not in DEFAULT_INTERFACES:
-            raise ValueError(f'Unknown interface name: {new_interface!r}')
-        new_interface = DEFAULT_INTERFACES[new_interface]()
+        new_interface = _make_interface(new_interface)
 
     if not isinstance(new_interface, Interface):
         raise TypeError(f"Expected an instance of Interface, got {type(new_interface)}")
 
-    actual_interface = new_interface
+    _install(new_interface)
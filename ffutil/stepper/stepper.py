@@ -4,7 +4,7 @@ from typing import Optional, TypeVar, Generic, Sequence, Literal, TypeAlias
 from ffutil.stepper.command import CommandCollection, CommandOutcome
 
 
-CursorType = TypeVar('CursorType')
+CursorType = TypeVar('CursorType')   # cursors are expected to be immutable (they get shared between states and modifications)
 
 
 class State(Generic[CursorType]):
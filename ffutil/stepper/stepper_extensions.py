@@ -1,10 +1,12 @@
-from copy import deepcopy
+import logging
 from typing import Optional, Generic
 
 from ffutil.stepper.command import Command, CommandInfo, CommandOutcome
 from ffutil.stepper.interface import interface
 from ffutil.stepper.stepper import Stepper, Modification, StateType, StopStepper, CursorType
 
+logger = logging.getLogger(__name__)
+
 
 #######################################################################
 #   QUIT COMMAND
@@ -49,18 +51,19 @@ class CursorModification(Modification[StateType], Generic[StateType, CursorType]
         self.new_cursor = new_cursor
 
     def apply(self, state: StateType):
-        # print(f'CursorModification: changing cursor from {state.cursor} to {self.new_cursor}')
+        logger.debug('CursorModification: changing cursor from %r to %r', state.cursor, self.new_cursor)
         state.cursor = self.new_cursor
 
     def unapply(self, state: StateType):
-        # print(f'CursorModification: changing cursor from {state.cursor} to {self.old_cursor}')
+        logger.debug('CursorModification: changing cursor from %r to %r', state.cursor, self.old_cursor)
         state.cursor = self.old_cursor
 
 
 class CursorModifyingStepper(Stepper[StateType]):
     def handle_command_outcome(self, outcome: CommandOutcome) -> Optional[Modification[StateType]]:
         if isinstance(outcome, SetCursorOutcome):
-            return CursorModification(deepcopy(self.state.cursor), deepcopy(outcome.new_cursor))
+            # cursors are immutable (frozen dataclasses), so they can be shared without copying
+            return CursorModification(self.state.cursor, outcome.new_cursor)
 
         return super().handle_command_outcome(outcome)
 
@@ -119,7 +122,7 @@ class UndoableStepper(Stepper[StateType]):
             for mod in reversed(mods):
                 mod.unapply(self.state)
                 self.reset_after_modification(mod)
-                self.modification_future.append(mods)
+            self.modification_future.append(mods)
         elif isinstance(outcome, RedoOutcome):
             mods = self.modification_future.pop()
             for mod in mods:
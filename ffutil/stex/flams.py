@@ -28,11 +28,16 @@ void free_string(char* s);
         lib.initialize()
         return lib
 
+    def _take_cstr(self, c_str) -> bytes:
+        """Copy a C string returned by FLAMS and free it."""
+        raw = self.ffi.string(c_str)
+        self.lib.free_string(c_str)
+        return raw
+
     def _cstr_to_json(self, c_str) -> Any:
         """Convert a C string to a JSON object."""
-        py_str = self.ffi.string(c_str).decode('utf-8')
-        self.lib.free_string(c_str)
-        return orjson.loads(py_str)
+        # orjson parses the utf-8 bytes directly (no need to decode into a str first)
+        return orjson.loads(self._take_cstr(c_str))
 
     def hello_world(self, arg: int):
         self.lib.hello_world(arg)
@@ -51,16 +56,12 @@ void free_string(char* s);
 
     def get_file_annotations(self, filepath: str | Path):
         filepath_c = self.ffi.new('char[]', str(filepath).encode('utf-8'))
-        c_str = self.lib.get_file_annotations(filepath_c)
-        py_str = self.ffi.string(c_str).decode('utf-8')
-        self.lib.free_string(c_str)
-        if not py_str:
+        raw = self._take_cstr(self.lib.get_file_annotations(filepath_c))
+        if not raw:
             self.load_file(filepath)
-            c_str = self.lib.get_file_annotations(filepath_c)
-            py_str = self.ffi.string(c_str).decode('utf-8')
-            self.lib.free_string(c_str)
-        if py_str:
-            return orjson.loads(py_str)
+            raw = self._take_cstr(self.lib.get_file_annotations(filepath_c))
+        if raw:
+            return orjson.loads(raw)
         return None
 
     def get_loaded_files(self) -> list[str]:
@@ -3,7 +3,8 @@ Code for working with local sTeX archives.
 
 This is mostly generic code, more specific code is in separate modules (for example for the catalogs).
 """
-from functools import cached_property
+import functools
+import itertools
 from pathlib import Path
 from typing import Optional, Iterable
 
@@ -59,22 +60,18 @@ class OpenedStexFLAMSFile:
     def __init__(self, path: str):
         self.path = path
 
-    @cached_property
+    @functools.cached_property
     def text(self) -> str:
         with open(self.path, 'r', encoding='utf-8') as f:
             return f.read()
 
-    @cached_property
+    @functools.cached_property
     def _linecharcount(self) -> list[int]:
         """ returns a list l where l[i] is the number of characters until the beginning of line i
             In FLAMS, lines are apparently 0-indexed.
         """
-        result: list[int] = [0]
-        value = 0
-        for line in self.text.splitlines(keepends=True):
-            value += len(line)
-            result.append(value)
-        return result
+        # accumulate/map keep the loop in C (this is computed for every file when building the catalog)
+        return [0, *itertools.accumulate(map(len, self.text.splitlines(keepends=True)))]
 
     def flams_range_to_offsets(self, flams_range) -> tuple[int, int]:
         lc = self._linecharcount
@@ -84,14 +81,14 @@ class OpenedStexFLAMSFile:
 
 
 def lang_from_path(path: str | Path) -> str:
-    if isinstance(path, Path):
-        segments = path.name.split('.')
-    else:
-        segments = path.split('/')[-1].split('.')
-    lang = 'en'   # default
-    if len(segments) > 2 and len(segments[-2]) < 5:
-        lang = segments[-2]
-    return lang
+    name = path.name if isinstance(path, Path) else path.rpartition('/')[2]
+    # name has the form <stem>.<lang>.<ext>
+    stem, dot, _ = name.rpartition('.')
+    if dot:
+        _, dot, lang = stem.rpartition('.')
+        if dot and len(lang) < 5:
+            return lang
+    return 'en'   # default
 
 
 def _find_module(annotations, uri: str) -> Optional[dict]:
@@ -153,6 +150,34 @@ def get_transitive_structs(structures: list[tuple[str, str]]) -> dict[str, str]:
     return result
 
 
+@functools.cache
+def _direct_imports(uri: str, path: str) -> tuple[tuple[str, str], ...]:
+    """ returns the (module_uri, module_path) pairs imported by the module (cached, see clear_import_caches) """
+    module = _find_module(FLAMS.get_file_annotations(path), uri)
+    if module is None:
+        return ()
+    return tuple(_find_imports(module))
+
+
+@functools.cache
+def _transitive_imports_of(uri: str, path: str) -> dict[str, str]:
+    """ like get_transitive_imports, but for a single module (cached - the result must not be modified) """
+    result: dict[str, str] = {uri: path}
+    stack = [(uri, path)]
+    while stack:
+        for import_uri, import_path in _direct_imports(*stack.pop()):
+            if import_uri not in result:
+                result[import_uri] = import_path
+                stack.append((import_uri, import_path))
+    return result
+
+
+def clear_import_caches():
+    """ has to be called when files were modified (their imports may have changed) """
+    _direct_imports.cache_clear()
+    _transitive_imports_of.cache_clear()
+
+
 def get_transitive_imports(modules: list[tuple[str, str]]) -> dict[str, str]:
     """
     given a list of (module_uri, module_path) pairs,
@@ -161,20 +186,13 @@ def get_transitive_imports(modules: list[tuple[str, str]]) -> dict[str, str]:
     """
     result: dict[str, str] = { uri: path for uri, path in modules }
 
-    def search(uri: str, path: str):
-        annos = FLAMS.get_file_annotations(path)
-
-        module = _find_module(annos, uri)
-        if module is None:
-            return
-        for import_uri, import_path in _find_imports(module):
-            if import_uri not in result:
-                result[import_uri] = import_path
-                search(import_uri, import_path)
-
     for uri, path in modules:
-        search(uri, path)
+        for import_uri, import_path in _transitive_imports_of(uri, path).items():
+            result.setdefault(import_uri, import_path)
 
     return result
 
 
+def get_transitive_import_uris(modules: list[tuple[str, str]]) -> frozenset[str]:
+    """ like get_transitive_imports, but only returns the module URIs (without building an intermediate dict) """
+    return frozenset().union(*(_transitive_imports_of(uri, path) for uri, path in modules))
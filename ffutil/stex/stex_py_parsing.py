@@ -2,6 +2,7 @@
 Code for parsing sTeX files.
 This is not based on FLAMS (FLAMS only extracts annotations, and we need the informal content as well).
 """
+import bisect
 from typing import Iterable, Optional
 
 from pylatexenc.latexwalker import get_default_latex_context_db, LatexWalker, LatexMathNode, LatexCommentNode, \
@@ -61,7 +62,6 @@ STEX_MACRO_SPECS: list = [
     MacroSpec('inlineex', '[{'),
     MacroSpec('inlineass', '[{'),
     MacroSpec('definiens', '[{'),
-    MacroSpec('definiens', '[{'),
     MacroSpec('vardef', '{[{'),
 ]
 
@@ -106,6 +106,11 @@ except AttributeError:   # freeze is only available in newer pylatexenc versions
     pass
 
 
+def make_latex_walker(text: str) -> LatexWalker:
+    """ creates a walker for sTeX code (all walkers share the frozen STEX_CONTEXT_DB) """
+    return LatexWalker(text, latex_context=STEX_CONTEXT_DB)
+
+
 #############
 # UTILITIES FOR MACRO ARGUMENTS
 #############
@@ -210,57 +215,70 @@ PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES: dict[str, tuple[bool, list[int]]] = {
     'lstlisting': (False, []),
     'tikzpicture': (False, []),
 }
+_DEFAULT_ENVIRONMENT_RULE: tuple[bool, list[int]] = (True, [])
+
+
+# the node walkers below dispatch on type(node) (faster than node.nodeType()), i.e. on the exact node classes
+_NON_ANNOTATABLE_NODE_TYPES = frozenset({LatexMathNode, LatexCommentNode, LatexSpecialsNode})
 
 
 def get_annotatable_plaintext(
         walker: LatexWalker,
         suppress_errors: bool = False,
+        nodes: Optional[list[LatexNode]] = None,   # the (already parsed) top-level nodes of the walker
 ) -> list[LinkedStr]:
     result: list[LinkedStr] = []
-    # walker = LatexWalker(latex_text, latex_context=STEX_CONTEXT_DB)
     latex_text = walker.s
-
-    def _recurse(nodes):
-        for node in nodes:
-            if node is None or node.nodeType() in {LatexMathNode, LatexCommentNode, LatexSpecialsNode}:
-                # TODO: recurse into math nodes?
-                continue
-            if node.nodeType() == LatexMacroNode:
-                if node.macroname in PLAINTEXT_EXTRACTION_MACRO_RECURSION:
-                    for arg_idx in PLAINTEXT_EXTRACTION_MACRO_RECURSION[node.macroname]:
-                        if arg_idx >= len(node.nodeargd.argnlist) and not suppress_errors:
-                            interface.clear()
-                            interface.write_header('Error', style='error')
-                            interface.write_text(f"Macro {node.macroname} does not have argument {arg_idx}",
-                                                 style='error')
-                            interface.write_text('\nContext:\n')
-                            interface.show_code(
-                                latex_text,
-                                format='tex',
-                                highlight_range=(node.pos, node.pos + node.len),
-                                limit_range=3,
-                            )
-                            interface.write_text('\n\nPlease report this error\n', style='bold')
-                            interface.await_confirmation()
-                            continue
-                        _recurse([node.nodeargd.argnlist[arg_idx]])
-            elif node.nodeType() == LatexEnvironmentNode:
-                if node.envname in PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES:
-                    recurse_content, recurse_args = PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES[node.envname]
-                else:
-                    recurse_content, recurse_args = True, []
-                for arg_idx in recurse_args:
-                    _recurse([node.nodeargd.argnlist[arg_idx]])
-                if recurse_content:
-                    _recurse(node.nodelist)
-            elif node.nodeType() == LatexGroupNode:
-                _recurse(node.nodelist)
-            elif node.nodeType() == LatexCharsNode:
-                result.append(string_to_lstr(node.chars, node.pos))
-            else:
-                raise RuntimeError(f"Unexpected node type: {node.nodeType()}")
-
-    _recurse(walker.get_latex_nodes()[0])
+    get_macro_rule = PLAINTEXT_EXTRACTION_MACRO_RECURSION.get
+    get_environment_rule = PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES.get
+
+    # explicit stack instead of recursion (faster and no recursion limit for deeply nested documents)
+    # children are pushed in reverse, so that the nodes are processed in document order
+    if nodes is None:
+        nodes = walker.get_latex_nodes()[0]
+    stack: list[Optional[LatexNode]] = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        node_type = type(node)
+        if node_type is LatexCharsNode:
+            result.append(string_to_lstr(node.chars, node.pos))
+        elif node_type in _NON_ANNOTATABLE_NODE_TYPES:
+            # TODO: recurse into math nodes?
+            continue
+        elif node_type is LatexMacroNode:
+            arg_indices = get_macro_rule(node.macroname)
+            if arg_indices is not None:
+                args = []
+                for arg_idx in arg_indices:
+                    if arg_idx >= len(node.nodeargd.argnlist) and not suppress_errors:
+                        interface.clear()
+                        interface.write_header('Error', style='error')
+                        interface.write_text(f"Macro {node.macroname} does not have argument {arg_idx}",
+                                             style='error')
+                        interface.write_text('\nContext:\n')
+                        interface.show_code(
+                            latex_text,
+                            format='tex',
+                            highlight_range=(node.pos, node.pos + node.len),
+                            limit_range=3,
+                        )
+                        interface.write_text('\n\nPlease report this error\n', style='bold')
+                        interface.await_confirmation()
+                        continue
+                    args.append(node.nodeargd.argnlist[arg_idx])
+                stack.extend(reversed(args))
+        elif node_type is LatexEnvironmentNode:
+            recurse_content, recurse_args = get_environment_rule(node.envname, _DEFAULT_ENVIRONMENT_RULE)
+            # the arguments come before the content
+            if recurse_content:
+                stack.extend(reversed(node.nodelist))
+            stack.extend(reversed([node.nodeargd.argnlist[arg_idx] for arg_idx in recurse_args]))
+        elif node_type is LatexGroupNode:
+            stack.extend(reversed(node.nodelist))
+        else:
+            raise RuntimeError(f"Unexpected node type: {node.nodeType()}")
 
     return result
 
@@ -292,60 +310,109 @@ def verbalization_from_macro(node: LatexMacroNode) -> str:
     return verbalization
 
 
+# macros that get replaced by their verbalization
+_VERBALIZATION_MACROS = frozenset({
+    'definiendum', 'definame', 'Definame',
+    'sn', 'sns', 'Sn', 'Sns', 'sr',
+})
+
+
 def get_plaintext_approx(
         walker: LatexWalker,
         formula_token: str = 'X',
+        nodes: Optional[list[LatexNode]] = None,   # the (already parsed) top-level nodes of the walker
 ) -> LinkedStr:
     result: list[LinkedStr] = []
+    get_macro_rule = PLAINTEXT_EXTRACTION_MACRO_RECURSION.get
+    get_environment_rule = PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES.get
 
     def _recurse(nodes):
         for node in nodes:
-            if node is None or node.nodeType() in {LatexCommentNode, LatexSpecialsNode}:
+            if node is None:
+                continue
+            node_type = type(node)
+            if node_type is LatexCharsNode:
+                result.append(string_to_lstr(node.chars, node.pos))
+            elif node_type is LatexCommentNode or node_type is LatexSpecialsNode:
                 continue
-            if node.nodeType() == LatexMathNode:
+            elif node_type is LatexMathNode:
                 result.append(fixed_range_lstr(formula_token, node.pos, node.pos + node.len))
-            elif node.nodeType() == LatexMacroNode:
-                if node.macroname in PLAINTEXT_EXTRACTION_MACRO_RECURSION:
-                    for arg_idx in PLAINTEXT_EXTRACTION_MACRO_RECURSION[node.macroname]:
+            elif node_type is LatexMacroNode:
+                arg_indices = get_macro_rule(node.macroname)
+                if arg_indices is not None:
+                    for arg_idx in arg_indices:
                         _recurse([node.nodeargd.argnlist[arg_idx]])
-                elif node.macroname in {
-                    'definiendum', 'definame', 'Definame',
-                    'sn', 'sns', 'Sn', 'Sns', 'sr',
-                }:
+                elif node.macroname in _VERBALIZATION_MACROS:
                     verbalization = verbalization_from_macro(node)
                     result.append(fixed_range_lstr(verbalization, node.pos, node.pos + node.len))
-            elif node.nodeType() == LatexEnvironmentNode:
-                if node.envname in PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES:
-                    recurse_content, recurse_args = PLAINTEXT_EXTRACTION_ENVIRONMENT_RULES[node.envname]
-                else:
-                    recurse_content, recurse_args = True, []
+            elif node_type is LatexEnvironmentNode:
+                recurse_content, recurse_args = get_environment_rule(node.envname, _DEFAULT_ENVIRONMENT_RULE)
                 for arg_idx in recurse_args:
                     _recurse([node.nodeargd.argnlist[arg_idx]])
                 if recurse_content:
                     _recurse(node.nodelist)
-            elif node.nodeType() == LatexGroupNode:
+            elif node_type is LatexGroupNode:
                 _recurse(node.nodelist)
-            elif node.nodeType() == LatexCharsNode:
-                result.append(string_to_lstr(node.chars, node.pos))
             else:
                 raise RuntimeError(f"Unexpected node type: {node.nodeType()}")
 
-    _recurse(walker.get_latex_nodes()[0])
+    _recurse(walker.get_latex_nodes()[0] if nodes is None else nodes)
 
     return concatenate_lstrs(result, None)
 
 
+_NODE_TYPES_WITH_NODELIST = frozenset({LatexMathNode, LatexGroupNode, LatexEnvironmentNode})
+_LEAF_NODE_TYPES = frozenset({LatexCommentNode, LatexCharsNode, LatexSpecialsNode})
+
+
 def iterate_latex_nodes(nodes) -> Iterable[LatexNode]:
     for node in nodes:
         yield node
-        if node is None or node.nodeType() in {LatexSpecialsNode}:
+        if node is None:
             continue
-        elif node.nodeType() in {LatexMacroNode}:
+        node_type = type(node)
+        if node_type in _LEAF_NODE_TYPES:
+            pass
+        elif node_type is LatexMacroNode:
             if node.nodeargd:
                 yield from iterate_latex_nodes(node.nodeargd.argnlist)
-        elif node.nodeType() in {LatexMathNode, LatexGroupNode, LatexEnvironmentNode}:
+        elif node_type in _NODE_TYPES_WITH_NODELIST:
             yield from iterate_latex_nodes(node.nodelist)
-        elif node.nodeType() in {LatexCommentNode, LatexCharsNode}:
-            pass
         else:
             raise RuntimeError(f"Unexpected node type: {node.nodeType()}")
+
+
+class EnvironmentIndex:
+    """ Index of the environments in a LaTeX node tree for quickly finding the environments around an offset.
+
+    Environments are stored sorted by their start position, together with the index of their parent environment.
+    The environments around an offset are then the last environment starting before the offset
+    and its ancestors (filtered to those that have not ended yet).
+    """
+
+    def __init__(self, nodes):
+        envs = sorted(
+            (node for node in iterate_latex_nodes(nodes) if isinstance(node, LatexEnvironmentNode)),
+            key=lambda node: node.pos,
+        )
+        self.starts: list[int] = [env.pos for env in envs]
+        self.ends: list[int] = [env.pos + env.len for env in envs]
+        self.envs: list[LatexEnvironmentNode] = envs
+        self.parents: list[int] = []   # index of the parent environment (-1 for top-level environments)
+        open_envs: list[int] = []
+        for i, env in enumerate(envs):
+            while open_envs and self.ends[open_envs[-1]] <= env.pos:
+                open_envs.pop()
+            self.parents.append(open_envs[-1] if open_envs else -1)
+            open_envs.append(i)
+
+    def get_surrounding_envs(self, offset: int) -> list[LatexEnvironmentNode]:
+        """ returns the environments containing the offset (outermost first) """
+        result: list[LatexEnvironmentNode] = []
+        i = bisect.bisect_right(self.starts, offset) - 1
+        while i >= 0:
+            if offset < self.ends[i]:
+                result.append(self.envs[i])
+            i = self.parents[i]
+        result.reverse()
+        return result
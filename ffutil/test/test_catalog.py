@@ -33,3 +33,18 @@ class TestCatalog(unittest.TestCase):
                 self.assertIsNotNone(match)
                 start, end = match[:2]
                 self.assertEqual(example[start:end], expected_string)
+
+    def test_catalogs_from_stream(self):
+        catalogs = catalogs_from_stream(
+            [
+                ('en', '?edge', Verbalization('edge')),
+                ('de', '?edge', Verbalization('Kante')),
+                ('en', '?edge', Verbalization('edges')),
+            ],
+            (symb for symb in ['?node']),   # symbols without verbalizations
+        )
+        self.assertEqual(set(catalogs), {'en', 'de'})
+        self.assertEqual(len(catalogs['en'].symb_to_verb['?edge']), 2)
+        for lang in ['en', 'de']:
+            with self.subTest(lang=lang):
+                self.assertEqual(set(catalogs[lang].symb_iter()), {'?edge', '?node'})
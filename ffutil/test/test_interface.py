@@ -0,0 +1,38 @@
+import unittest
+
+from ffutil.stepper.interface import _get_lines_around
+
+
+EXAMPLE = 'a\nbb\n\nccc\ndddd\ne\n\nf'
+
+
+def naive_lines_around(text: str, start: int, end: int, n_lines: int) -> tuple[str, str, str, int]:
+    start_index = start
+    for _ in range(n_lines):
+        if start_index > 0:
+            start_index -= 1
+        while start_index > 0 and text[start_index - 1] != '\n':
+            start_index -= 1
+
+    end_index = end
+    for _ in range(n_lines):
+        if end_index + 1 < len(text):
+            end_index += 1
+        while end_index + 1 < len(text) and text[end_index + 1] != '\n':
+            end_index += 1
+    end_index += 1
+
+    return text[start_index:start], text[start:end], text[end:end_index], text[:start_index].count('\n') + 1
+
+
+class TestGetLinesAround(unittest.TestCase):
+    def test_matches_naive_scan(self):
+        for text in [EXAMPLE, EXAMPLE + '\n', '\n' + EXAMPLE]:
+            for start in range(len(text)):
+                for end in range(start, len(text)):
+                    for n_lines in range(1, 4):
+                        with self.subTest(text=text, start=start, end=end, n_lines=n_lines):
+                            self.assertEqual(
+                                _get_lines_around(text, start, end, n_lines=n_lines),
+                                naive_lines_around(text, start, end, n_lines),
+                            )
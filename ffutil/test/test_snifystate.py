@@ -0,0 +1,39 @@
+import pickle
+import unittest
+
+from ffutil.snify.snifystate import SnifyCursor
+from ffutil.stepper.document_stepper import DocumentCursor
+
+
+# cursors as pickled in stored sessions by earlier versions
+LEGACY_PICKLES = [
+    (
+        b'\x80\x04\x95X\x00\x00\x00\x00\x00\x00\x00\x8c\x17ffutil.snify.snifystate\x94\x8c\x0bSnifyCursor\x94\x93\x94)'
+        b'\x81\x94}\x94(\x8c\x0edocument_index\x94K\x03\x8c\tselection\x94K\x05K\t\x86\x94ub.',
+        SnifyCursor(3, (5, 9)),
+    ),
+    (
+        b'\x80\x04\x95T\x00\x00\x00\x00\x00\x00\x00\x8c\x17ffutil.snify.snifystate\x94\x8c\x0bSnifyCursor\x94\x93\x94)'
+        b'\x81\x94}\x94(\x8c\x0edocument_index\x94K\x01\x8c\tselection\x94K\x07ub.',
+        SnifyCursor(1, 7),
+    ),
+    (
+        b'\x80\x04\x95P\x00\x00\x00\x00\x00\x00\x00\x8c\x1fffutil.stepper.document_stepper\x94\x8c\x0eDocumentCursor'
+        b'\x94\x93\x94)\x81\x94}\x94\x8c\x0edocument_index\x94K\x02sb.',
+        DocumentCursor(2),
+    ),
+]
+
+
+class TestCursorPickling(unittest.TestCase):
+    def test_legacy_pickles(self):
+        for data, expected in LEGACY_PICKLES:
+            with self.subTest(expected=expected):
+                cursor = pickle.loads(data)
+                self.assertIs(type(cursor), type(expected))
+                self.assertEqual(cursor, expected)
+
+    def test_round_trip(self):
+        for cursor in [SnifyCursor(3, (5, 9)), SnifyCursor(1, 7), DocumentCursor(2)]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(pickle.loads(pickle.dumps(cursor)), cursor)
@@ -0,0 +1,121 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from ffutil.snify import skip_and_ignore
+from ffutil.snify.catalog import catalogs_from_stream, Verbalization
+from ffutil.snify.snifystate import SnifyState, SnifyCursor
+from ffutil.snify.snifystepper import SnifyStepper
+from ffutil.stepper.document import STeXDocument
+from ffutil.stepper.document_stepper import SubstitutionOutcome
+from ffutil.stepper.stepper_extensions import SetCursorOutcome, UndoOutcome, RedoOutcome, RedoCommand
+from ffutil.stex.flams import FLAMS
+from ffutil.test.test_stepper import run_outcomes
+
+
+CONTENT = r'''\begin{document}
+An integer is an integer.
+\end{document}
+'''
+
+
+class SnifyStepperTestCase(unittest.TestCase):
+    """ a stepper for the CONTENTS (FLAMS only reports empty files, and the ignore lists are empty) """
+    CONTENTS = [CONTENT]
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        for patch in [
+            mock.patch.object(FLAMS, 'get_file_annotations', return_value=None),
+            mock.patch.object(FLAMS, 'load_file'),
+            mock.patch.object(skip_and_ignore, 'CONFIG_DIR', Path(tmp_dir.name)),
+            mock.patch.dict(skip_and_ignore.IgnoreList._instances, clear=True),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.documents = []
+        for i, content in enumerate(self.CONTENTS):
+            path = Path(tmp_dir.name) / f'doc{i}.en.tex'
+            path.write_text(content)
+            self.documents.append(STeXDocument(path, 'en'))
+        catalog = catalogs_from_stream([('en', '?int', Verbalization('integer'))])['en']
+        self.stepper = SnifyStepper(SnifyState(SnifyCursor(0, 0), self.documents))
+        self.stepper.get_stex_catalogs = lambda: {'en': catalog}   # type: ignore
+        self.stepper.ensure_state_up_to_date()
+
+    def selected_text(self) -> str:
+        start, end = self.stepper.state.cursor.selection
+        return self.stepper.state.get_current_document().get_content()[start:end]
+
+
+class TestCommandCollectionCache(SnifyStepperTestCase):
+    def test_reused_if_nothing_changed(self):
+        self.assertIs(self.stepper.get_current_command_collection(), self.stepper.get_current_command_collection())
+
+    def test_cursor_move(self):
+        collection = self.stepper.get_current_command_collection()
+        run_outcomes(self.stepper, [SetCursorOutcome(SnifyCursor(0, self.stepper.state.cursor.selection[1]))])
+        self.stepper.ensure_state_up_to_date()
+        self.assertIsNot(self.stepper.get_current_command_collection(), collection)
+
+    def test_cursor_move_without_modification(self):
+        # the cursor gets moved to the second "integer" (with the same annotation choices as the first one)
+        collection = self.stepper.get_current_command_collection()
+        self.stepper.state.cursor = SnifyCursor(0, self.stepper.state.cursor.selection[1])
+        self.stepper.ensure_state_up_to_date()
+        self.assertEqual(self.selected_text(), 'integer')
+        self.assertIsNot(self.stepper.get_current_command_collection(), collection)
+
+    def test_file_modification_and_undo_redo(self):
+        collection = self.stepper.get_current_command_collection()
+        # modifications that leave the cursor (and the annotation choices) as they are
+        run_outcomes(self.stepper, [SubstitutionOutcome('an', 17, 19)])
+        self.assertEqual(self.selected_text(), 'integer')
+        after_modification = self.stepper.get_current_command_collection()
+        self.assertIsNot(after_modification, collection)
+
+        run_outcomes(self.stepper, [UndoOutcome()])
+        after_undo = self.stepper.get_current_command_collection()
+        self.assertIsNot(after_undo, after_modification)
+        redo_command = next(command for command in after_undo.commands if isinstance(command, RedoCommand))
+        self.assertTrue(redo_command.is_possible)
+
+        run_outcomes(self.stepper, [RedoOutcome()])
+        after_redo = self.stepper.get_current_command_collection()
+        self.assertIsNot(after_redo, after_undo)
+
+        # undo and a different modification (the history then has the same size as after the redo)
+        run_outcomes(self.stepper, [UndoOutcome()])
+        run_outcomes(self.stepper, [SubstitutionOutcome('AN', 17, 19)])
+        self.assertIsNot(self.stepper.get_current_command_collection(), after_redo)
+
+
+class TestExhaustedDocuments(SnifyStepperTestCase):
+    CONTENTS = [CONTENT, CONTENT]
+    END_OF_MATCHES = CONTENT.index('integer.') + len('integer')   # nothing to annotate from here on
+
+    def exhaust_first_document(self):
+        run_outcomes(self.stepper, [SetCursorOutcome(SnifyCursor(0, self.END_OF_MATCHES))])
+        self.stepper.ensure_state_up_to_date()
+        self.assertEqual(self.stepper.state.cursor.document_index, 1)
+
+    def test_not_rescanned_when_exhausted(self):
+        self.exhaust_first_document()
+        run_outcomes(self.stepper, [SetCursorOutcome(SnifyCursor(0, self.END_OF_MATCHES))])
+        with mock.patch.object(self.documents[0], 'get_annotatable_plaintext_from', side_effect=AssertionError):
+            self.stepper.ensure_state_up_to_date()
+        self.assertEqual(self.stepper.state.cursor.document_index, 1)
+
+    def test_rescanned_after_modification(self):
+        self.exhaust_first_document()
+        run_outcomes(self.stepper, [
+            SetCursorOutcome(SnifyCursor(0, self.END_OF_MATCHES)),
+            SubstitutionOutcome(' integer', self.END_OF_MATCHES, self.END_OF_MATCHES),
+        ])
+        self.stepper.ensure_state_up_to_date()
+        self.assertEqual(self.stepper.state.cursor.document_index, 0)
+        self.assertEqual(self.stepper.state.cursor.selection[0], self.END_OF_MATCHES + 1)
+        self.assertEqual(self.selected_text(), 'integer')
@@ -0,0 +1,63 @@
+import unittest
+from typing import Sequence
+from unittest import mock
+
+from ffutil.stepper.command import CommandOutcome
+from ffutil.stepper.stepper import State, Modification, Stepper
+from ffutil.stepper.stepper_extensions import UndoableStepper, UndoOutcome, RedoOutcome
+
+
+class _ValuesState(State[None]):
+    def __init__(self):
+        super().__init__(None)
+        self.values: dict[str, int] = {}
+
+
+class _SetValue(CommandOutcome, Modification[_ValuesState]):
+    def __init__(self, key: str, value: int):
+        self.key = key
+        self.value = value
+        self.old_value: int | None = None
+
+    def apply(self, state: _ValuesState):
+        self.old_value = state.values.get(self.key)
+        state.values[self.key] = self.value
+
+    def unapply(self, state: _ValuesState):
+        if self.old_value is None:
+            del state.values[self.key]
+        else:
+            state.values[self.key] = self.old_value
+
+
+class _TestStepper(UndoableStepper, Stepper[_ValuesState]):
+    def show_current_state(self):
+        raise NotImplementedError()
+
+    def get_current_command_collection(self):
+        raise NotImplementedError()
+
+
+def run_outcomes(stepper: Stepper, outcomes: Sequence[CommandOutcome]):
+    """ runs a stepper iteration (without output) in which the command collection returns the given outcomes """
+    with mock.patch.object(stepper, 'show_current_state'), \
+            mock.patch.object(stepper, 'get_current_command_collection', return_value=mock.Mock(apply=lambda: outcomes)):
+        stepper._single_iteration()
+
+
+class TestUndoableStepper(unittest.TestCase):
+    def test_undo_redo_group(self):
+        stepper = _TestStepper(_ValuesState())
+        run_outcomes(stepper, [_SetValue('a', 1)])
+        run_outcomes(stepper, [_SetValue('a', 2), _SetValue('b', 3), _SetValue('c', 4)])
+        self.assertEqual(stepper.state.values, {'a': 2, 'b': 3, 'c': 4})
+
+        run_outcomes(stepper, [UndoOutcome()])
+        self.assertEqual(stepper.state.values, {'a': 1})
+        self.assertEqual(len(stepper.modification_history), 1)
+        self.assertEqual(len(stepper.modification_future), 1)
+
+        run_outcomes(stepper, [RedoOutcome()])
+        self.assertEqual(stepper.state.values, {'a': 2, 'b': 3, 'c': 4})
+        self.assertEqual(len(stepper.modification_history), 2)
+        self.assertEqual(len(stepper.modification_future), 0)
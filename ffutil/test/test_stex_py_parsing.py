@@ -0,0 +1,30 @@
+import unittest
+
+from pylatexenc.latexwalker import LatexEnvironmentNode
+
+from ffutil.stex.stex_py_parsing import EnvironmentIndex, iterate_latex_nodes, make_latex_walker
+
+
+EXAMPLE = r'''\begin{document}
+\begin{smodule}{a}
+\importmodule{x}
+\begin{sdefinition} an \begin{itemize}\item example\end{itemize} \end{sdefinition}
+\begin{sparagraph}\begin{frame}x\end{frame}\end{sparagraph}
+\end{smodule}
+\begin{smodule}{b}y\end{smodule}
+\end{document}
+'''
+
+
+class TestEnvironmentIndex(unittest.TestCase):
+    def test_surrounding_envs(self):
+        nodes = make_latex_walker(EXAMPLE).get_latex_nodes()[0]
+        index = EnvironmentIndex(nodes)
+        for offset in range(len(EXAMPLE) + 1):
+            with self.subTest(offset=offset):
+                expected = [
+                    node.pos
+                    for node in iterate_latex_nodes(nodes)
+                    if isinstance(node, LatexEnvironmentNode) and node.pos <= offset < node.pos + node.len
+                ]
+                self.assertEqual([env.pos for env in index.get_surrounding_envs(offset)], expected)
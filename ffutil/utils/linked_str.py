@@ -255,11 +255,12 @@ class LinkedStr(Generic[_MetaInfoType]):
 
 
 def string_to_lstr(string: str, ref_offset: int = 0) -> LinkedStr[None]:
+    # ranges instead of lists: constant memory and slicing them (for sub-linked-strs) is O(1)
     return LinkedStr(
         meta_info=None,
         string=string,
-        start_refs=list(range(ref_offset, len(string) + ref_offset)),
-        end_refs=list(range(1 + ref_offset, len(string) + 1 + ref_offset))
+        start_refs=range(ref_offset, len(string) + ref_offset),
+        end_refs=range(1 + ref_offset, len(string) + 1 + ref_offset)
     )
 
 def fixed_range_lstr(string: str, start_ref: int, end_ref: int) -> LinkedStr[None]: